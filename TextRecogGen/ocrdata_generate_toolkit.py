@@ -1,21 +1,570 @@
 import os
+import mmap
 import random
 import json
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from tqdm import tqdm
 from PIL import Image, ImageDraw, ImageFont
 
+def _build_alias_table(weights):
+    # Vose's alias method: O(n) build, O(1) weighted draw
+    num = len(weights)
+    total = float(sum(weights))
+    prob = [weight * num / total for weight in weights]
+    alias = [0] * num
+    small = [i for i, p in enumerate(prob) if p < 1.0]
+    large = [i for i, p in enumerate(prob) if p >= 1.0]
+    while len(small) > 0 and len(large) > 0:
+        s, l = small.pop(), large.pop()
+        alias[s] = l
+        prob[l] = prob[l] + prob[s] - 1.0
+        if prob[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+class WordCorpus():
+    # Word lists kept memory-mapped, with only the start byte offset of each non-empty
+    # line held in one array (uint32 when the file is under 4 GiB). sample() picks a
+    # source with an alias table over the source weights, then a line uniformly inside
+    # that source. Behaves like a read-only list (len / indexing) over all sources.
+    def __init__(self, sources, chunk_size: int = 64 * 1024 * 1024) -> None:
+        # a single path, or a list of [path, weight]
+        if isinstance(sources, str):
+            sources = [[sources, 1.0]]
+
+        self.maps = []
+        self.starts = []
+        weights = []
+        for path, weight in sources:
+            if weight <= 0 or os.path.getsize(path) == 0:
+                continue
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            starts = self._index_lines(mm, chunk_size)
+            if len(starts) == 0:
+                continue
+            self.maps.append(mm)
+            self.starts.append(starts)
+            weights.append(weight)
+
+        if len(self.maps) == 0:
+            raise ValueError(f"No words found in {sources}")
+
+        self.sizes = np.asarray([len(starts) for starts in self.starts], dtype=np.int64)
+        self.cumulative_sizes = np.cumsum(self.sizes)
+        self.alias_prob, self.alias = _build_alias_table(weights)
+
+    def _index_lines(self, mm, chunk_size):
+        # line starts found chunk by chunk and stored in the final dtype right away, so the
+        # only full-size allocation is the index itself (plus its per-chunk parts)
+        data = np.frombuffer(mm, dtype=np.uint8)
+        size = len(data)
+        dtype = np.uint32 if size < 2 ** 32 else np.int64
+        newline, carriage_return = ord('\n'), ord('\r')
+
+        parts = []
+        for begin in range(0, size, chunk_size):
+            starts = np.flatnonzero(data[begin: begin + chunk_size] == newline) + (begin + 1)
+            if begin == 0:
+                starts = np.concatenate([[0], starts])
+            starts = starts[starts < size]
+
+            # skip the empty lines, "\n" or "\r\n" (or a lone "\r" at the end of the file)
+            first = data[starts]
+            second = data[np.minimum(starts + 1, size - 1)]
+            empty = (first == newline) | (
+                (first == carriage_return) & ((starts + 1 >= size) | (second == newline))
+            )
+            parts.append(starts[~empty].astype(dtype))
+
+        del data
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def _get(self, source, index):
+        # the line ends at the next "\n" (or at the end of the file), minus a CRLF "\r"
+        mm = self.maps[source]
+        start = int(self.starts[source][index])
+        end = mm.find(b'\n', start)
+        if end == -1:
+            end = len(mm)
+        if end > start and mm[end - 1] == ord('\r'):
+            end -= 1
+        return mm[start:end].decode('utf-8')
+
+    def __len__(self):
+        return int(self.cumulative_sizes[-1])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("WordCorpus index out of range")
+        source = int(np.searchsorted(self.cumulative_sizes, index, side='right'))
+        if source > 0:
+            index -= int(self.cumulative_sizes[source - 1])
+        return self._get(source, index)
+
+    def sample(self):
+        source = random.randrange(len(self.alias))
+        if random.random() >= self.alias_prob[source]:
+            source = self.alias[source]
+        return self._get(source, random.randrange(int(self.sizes[source])))
+
+class WordMaskCache():
+    # LRU cache of rasterized grayscale word masks keyed by (text, font file, font size).
+    # Each entry keeps the mask and its bbox offset from the draw position, so drawing
+    # a cached word is only a recolor + paste with the mask as alpha.
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.masks = OrderedDict()
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text, font):
+        key = (text, font.path, font.size)
+        entry = self.masks.get(key)
+        if entry is not None:
+            self.masks.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        x0, y0, x1, y1 = font.getbbox(text)
+        mask = Image.new("L", (max(1, x1 - x0), max(1, y1 - y0)), 0)
+        ImageDraw.Draw(mask).text((-x0, -y0), text, font=font, fill=255)
+        entry = (mask, (x0, y0))
+
+        # a mask bigger than the whole budget is returned but never stored
+        mask_bytes = mask.width * mask.height
+        if mask_bytes <= self.max_bytes:
+            self.masks[key] = entry
+            self.current_bytes += mask_bytes
+            while self.current_bytes > self.max_bytes:
+                _, (old_mask, _) = self.masks.popitem(last=False)
+                self.current_bytes -= old_mask.width * old_mask.height
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.masks),
+            "bytes": self.current_bytes,
+        }
+
+class AsyncImageWriter():
+    # Encode + write images on a thread pool, PIL releases the GIL in its codecs so this
+    # overlaps with rendering. At most max_pending writes are in flight, submit() waits
+    # for the oldest one beyond that (and re-raises its error, if any).
+    def __init__(self, num_workers: int = 4, max_pending: int = 64) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.pending = deque()
+        self.max_pending = max_pending
+
+    def submit(self, image, path):
+        self.pending.append(self.executor.submit(image.save, path))
+        while len(self.pending) > self.max_pending:
+            self.pending.popleft().result()
+
+    def close(self):
+        try:
+            while len(self.pending) > 0:
+                self.pending.popleft().result()
+        finally:
+            self.executor.shutdown()
+
+class BackgroundPrefetcher():
+    # Decode backgrounds ahead of time on a thread pool. The background names are picked
+    # on the caller thread, so the random sequence does not depend on thread timing.
+    def __init__(self, decode_fn, background_list, num_workers: int = 2, prefetch: int = 8) -> None:
+        self.decode_fn = decode_fn
+        self.background_list = background_list
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.queue = deque()
+        for _ in range(prefetch):
+            self._submit()
+
+    def _submit(self):
+        image_name = random.choice(self.background_list)
+        self.queue.append(self.executor.submit(self.decode_fn, image_name))
+
+    def get(self):
+        self._submit()
+        return self.queue.popleft().result()
+
+    def close(self):
+        # cancel the queued decodes by hand, shutdown(cancel_futures=True) needs python 3.9
+        for future in self.queue:
+            future.cancel()
+        self.queue.clear()
+        self.executor.shutdown()
+
+class RecTensorStoreWriter():
+    # Recognition crops resized to a fixed height, stored as raw uint8 (HWC) one after
+    # another in images.bin. offsets.npy / widths.npy index the crops and the labels are
+    # kept as UTF-32 code points in labels.npy, sliced by label_offsets.npy.
+    def __init__(self, folder, height: int = 32, mode: str = "RGB") -> None:
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.height = height
+        self.mode = mode
+        self.channels = len(Image.new(mode, (1, 1)).getbands())
+
+        # flat typed arrays, not one python object per crop, converted once in close()
+        self.file = open(os.path.join(folder, "images.bin"), "wb")
+        self.offset = 0
+        self.offsets = array('q')
+        self.widths = array('i')
+        self.labels = array('I')
+        self.label_offsets = array('q', [0])
+
+    def add(self, crop_image, text):
+        crop_image = crop_image.convert(self.mode)
+        width = max(1, round(crop_image.width * self.height / max(1, crop_image.height)))
+        data = crop_image.resize((width, self.height), Image.BILINEAR).tobytes()
+        self.file.write(data)
+        self.offsets.append(self.offset)
+        self.widths.append(width)
+        self.offset += len(data)
+
+        self.labels.extend(ord(char) for char in text)
+        self.label_offsets.append(len(self.labels))
+
+    def close_file(self):
+        # only images.bin, safe to call when the generation failed
+        if not self.file.closed:
+            self.file.close()
+
+    def close(self):
+        # the index files and meta.json are only written for a complete store
+        self.close_file()
+        np.save(os.path.join(self.folder, "offsets.npy"), np.frombuffer(self.offsets, dtype=np.int64))
+        np.save(os.path.join(self.folder, "widths.npy"), np.frombuffer(self.widths, dtype=np.int32))
+        np.save(os.path.join(self.folder, "labels.npy"), np.frombuffer(self.labels, dtype=np.uint32).astype("<u4"))
+        np.save(os.path.join(self.folder, "label_offsets.npy"), np.frombuffer(self.label_offsets, dtype=np.int64))
+        with open(os.path.join(self.folder, "meta.json"), 'w') as f:
+            json.dump({
+                "height": self.height,
+                "mode": self.mode,
+                "channels": self.channels,
+                "dtype": "uint8",
+                "layout": "HWC",
+                "num_samples": len(self.offsets),
+            }, f)
+
+class RecTensorStore():
+    # Reader for RecTensorStoreWriter output, crops are zero-copy views on a memmap.
+    def __init__(self, folder) -> None:
+        with open(os.path.join(folder, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        self.height = meta["height"]
+        self.channels = meta["channels"]
+        self.num_samples = meta["num_samples"]
+
+        if self.num_samples > 0:
+            self.images = np.memmap(os.path.join(folder, "images.bin"), dtype=np.uint8, mode="r")
+        else:
+            self.images = np.zeros(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        self.widths = np.load(os.path.join(folder, "widths.npy"), mmap_mode="r")
+        self.labels = np.load(os.path.join(folder, "labels.npy"), mmap_mode="r")
+        self.label_offsets = np.load(os.path.join(folder, "label_offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, index):
+        offset = int(self.offsets[index])
+        width = int(self.widths[index])
+        image = self.images[offset: offset + self.height * width * self.channels]
+        image = image.reshape(self.height, width, self.channels)
+
+        label = self.labels[int(self.label_offsets[index]): int(self.label_offsets[index + 1])]
+        text = label.tobytes().decode("utf-32-le")
+        return image, text
+
+class ContactSheet():
+    # Tile each scene (with its boxes) and all of its text crops (with labels) into one
+    # image per batch, so a config can be reviewed from a single file on a headless server.
+    def __init__(
+            self,
+            font_path = None,
+            thumb_size: int = 512,
+            crops_width: int = 1024,
+            crop_height: int = 48,
+            label_size: int = 16) -> None:
+        self.thumb_size = thumb_size
+        self.crops_width = crops_width
+        self.crop_height = crop_height
+        self.label_height = label_size + 6
+        self.padding = 8
+        if font_path is None:
+            self.font = ImageFont.load_default()
+        else:
+            self.font = ImageFont.truetype(font_path, label_size)
+        self.entries = []
+
+    def add(self, name, image, crops, texts, quads):
+        self.entries.append((name, image.convert("RGB"), crops, texts, quads))
+
+    def _render_row(self, name, image, crops, texts, quads):
+        width, height = image.size
+        scale = min(self.thumb_size / width, self.thumb_size / height, 1.0)
+        thumb = image.resize((max(1, int(width * scale)), max(1, int(height * scale))))
+        draw = ImageDraw.Draw(thumb)
+        for quad in quads:
+            draw.rectangle([value * scale for value in quad], outline=(255, 0, 0), width=2)
+
+        # crops resized to crop_height, label below, flowed left to right
+        cells = []
+        for crop, text in zip(crops, texts):
+            crop_width = max(1, round(crop.width * self.crop_height / max(1, crop.height)))
+            crop_width = min(crop_width, self.crops_width)
+            cell_width = min(self.crops_width, max(crop_width, int(self.font.getlength(text)) + 1))
+            cell = Image.new("RGB", (cell_width, self.crop_height + self.label_height), "white")
+            cell.paste(crop.convert("RGB").resize((crop_width, self.crop_height)), (0, 0))
+            ImageDraw.Draw(cell).text((0, self.crop_height + 2), text, font=self.font, fill="black")
+            cells.append(cell)
+
+        positions = []
+        x, y, line_height = 0, self.label_height, 0
+        for cell in cells:
+            if x > 0 and x + cell.width > self.crops_width:
+                x, y, line_height = 0, y + line_height + self.padding, 0
+            positions.append((x, y))
+            x += cell.width + self.padding
+            line_height = max(line_height, cell.height)
+
+        row_height = max(self.label_height + thumb.height, y + line_height) + self.padding
+        row = Image.new("RGB", (self.thumb_size + self.padding + self.crops_width, row_height), (230, 230, 230))
+        ImageDraw.Draw(row).text(
+            (0, 0), f"{name} - {width}x{height} - {len(crops)} texts", font=self.font, fill="black"
+        )
+        row.paste(thumb, (0, self.label_height))
+        for cell, (x, y) in zip(cells, positions):
+            row.paste(cell, (self.thumb_size + self.padding + x, y))
+        return row
+
+    def save(self, path):
+        rows = [self._render_row(*entry) for entry in self.entries]
+        sheet = Image.new(
+            "RGB", 
+            (self.thumb_size + self.padding + self.crops_width, max(1, sum(row.height for row in rows))), 
+            "white"
+        )
+        y = 0
+        for row in rows:
+            sheet.paste(row, (0, y))
+            y += row.height
+        sheet.save(path)
+        self.entries = []
+
+class MMOCRExporter():
+    # det_train.json / rec_train.json in the MMOCR format
+    def __init__(self, root, det_file = "det_train.json", rec_file = "rec_train.json") -> None:
+        self.root = root
+        self.det_file = det_file
+        self.rec_file = rec_file
+        self.detectset = {
+            "metainfo":{
+                "dataset_type":"TextDetDataset",
+                "task_name":"textdet",
+                "category":[{
+                    "id":0,
+                    "name":"text"
+                }]
+            },
+            "data_list":[]
+            }
+        self.recogset = {
+            "metainfo":{
+                "dataset_type":"TextRecogDataset",
+                "task_name":"textrecog"
+            },
+            "data_list":[]
+            }
+
+    def add_image(self, image_id, img_path, width, height, result_dec, result_rec):
+        self.detectset["data_list"].append({
+            "instances": result_dec,
+            "img_path": img_path,
+            "height": height,
+            "width": width,
+        })
+        self.recogset["data_list"] += (result_rec)
+
+    def close(self):
+        with open(os.path.join(self.root, self.det_file), 'w') as f:
+            json.dump(self.detectset, f)
+        if self.rec_file is not None:
+            with open(os.path.join(self.root, self.rec_file), 'w') as f:
+                json.dump(self.recogset, f)
+
+class COCOExporter():
+    # coco_train.json for the COCO tools (cocoapi), the text of each box is kept in "text"
+    def __init__(self, root, coco_file = "coco_train.json") -> None:
+        self.root = root
+        self.coco_file = coco_file
+        self.images = []
+        self.annotations = []
+
+    def add_image(self, image_id, img_path, width, height, result_dec, result_rec):
+        self.images.append({
+            "id": image_id,
+            "file_name": img_path,
+            "width": width,
+            "height": height,
+        })
+        if len(result_dec) == 0:
+            return
+
+        # (x1, y1, x2, y2) -> (x, y, w, h) for all the boxes of the image at once
+        boxes = np.asarray([dec["bbox"] for dec in result_dec], dtype=np.float64)
+        xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+        areas = xywh[:, 2] * xywh[:, 3]
+        segmentations = np.asarray([dec["polygon"] for dec in result_dec], dtype=np.float64).reshape(len(result_dec), -1)
+
+        for dec, rec, bbox, area, segmentation in zip(result_dec, result_rec, xywh.tolist(), areas.tolist(), segmentations.tolist()):
+            self.annotations.append({
+                "id": len(self.annotations) + 1,
+                "image_id": image_id,
+                "category_id": 1,
+                "bbox": bbox,
+                "area": area,
+                "segmentation": [segmentation],
+                "iscrowd": 1 if dec["ignore"] else 0,
+                "text": rec["instances"][0]["text"],
+            })
+
+    def close(self):
+        with open(os.path.join(self.root, self.coco_file), 'w') as f:
+            json.dump({
+                "images": self.images,
+                "annotations": self.annotations,
+                "categories": [{"id": 1, "name": "text"}],
+            }, f)
+
+class YOLOExporter():
+    # one label file per image: "class cx cy w h", normalized by the image size.
+    # The labels are written next to the scenes (textdet/image_{i}.txt): YOLOv5 maps an
+    # image to its label by replacing the last /images/ of the path with /labels/, and
+    # textdet/ has no /images/ part, so it reads the .txt beside the .jpg.
+    def __init__(self, root, label_dir = "textdet") -> None:
+        self.label_dir = os.path.join(root, label_dir)
+        os.makedirs(self.label_dir, exist_ok=True)
+
+    def add_image(self, image_id, img_path, width, height, result_dec, result_rec):
+        lines = []
+        if len(result_dec) > 0:
+            boxes = np.asarray([dec["bbox"] for dec in result_dec], dtype=np.float64)
+            boxes = np.clip(boxes / [width, height, width, height], 0.0, 1.0)
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            sizes = boxes[:, 2:] - boxes[:, :2]
+            lines = [
+                f"0 {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+                for (cx, cy), (w, h) in zip(centers.tolist(), sizes.tolist())
+            ]
+        label_name = os.path.splitext(os.path.basename(img_path))[0] + ".txt"
+        with open(os.path.join(self.label_dir, label_name), 'w') as f:
+            f.write("\n".join(lines) + ("\n" if len(lines) > 0 else ""))
+
+    def close(self):
+        pass
+
+class RecBucketExporter():
+    # rec_buckets.json: indices into rec_train.json grouped by crop aspect ratio (w / h)
+    # and crop height, from the sizes recorded at generation time, so a loader can build
+    # tightly packed batches without opening any crop
+    def __init__(
+            self, 
+            root, 
+            bucket_file = "rec_buckets.json",
+            aspect_ratio_edges = [1, 2, 3, 4, 6, 8, 12, 16, 24, 32],
+            height_edges = [16, 32, 64, 128, 256]) -> None:
+        self.root = root
+        self.bucket_file = bucket_file
+        self.aspect_ratio_edges = aspect_ratio_edges
+        self.height_edges = height_edges
+        self.widths = []
+        self.heights = []
+
+    def add_image(self, image_id, img_path, width, height, result_dec, result_rec):
+        for rec in result_rec:
+            self.widths.append(rec["width"])
+            self.heights.append(rec["height"])
+
+    def _edge_range(self, edges, bucket):
+        # bucket i covers [edges[i - 1], edges[i]), None for an open end
+        low = edges[bucket - 1] if bucket > 0 else None
+        high = edges[bucket] if bucket < len(edges) else None
+        return [low, high]
+
+    def close(self):
+        widths = np.asarray(self.widths, dtype=np.float64)
+        heights = np.asarray(self.heights, dtype=np.float64)
+        aspect_ratio_buckets = np.digitize(widths / np.maximum(heights, 1), self.aspect_ratio_edges)
+        height_buckets = np.digitize(heights, self.height_edges)
+
+        # sort once by (aspect ratio bucket, height bucket), then split on the changes
+        keys = aspect_ratio_buckets * (len(self.height_edges) + 1) + height_buckets
+        order = np.argsort(keys, kind="stable")
+        splits = np.flatnonzero(np.diff(keys[order])) + 1
+
+        buckets = []
+        for indices in np.split(order, splits):
+            if len(indices) == 0:
+                continue
+            buckets.append({
+                "aspect_ratio": self._edge_range(self.aspect_ratio_edges, int(aspect_ratio_buckets[indices[0]])),
+                "height": self._edge_range(self.height_edges, int(height_buckets[indices[0]])),
+                "max_width": int(widths[indices].max()),
+                "max_height": int(heights[indices].max()),
+                "indices": indices.tolist(),
+            })
+
+        with open(os.path.join(self.root, self.bucket_file), 'w') as f:
+            json.dump({
+                "metainfo":{
+                    "rec_file": "rec_train.json",
+                    "aspect_ratio_edges": self.aspect_ratio_edges,
+                    "height_edges": self.height_edges,
+                },
+                "buckets": buckets,
+            }, f)
+
+EXPORTERS = {
+    "mmocr": MMOCRExporter,
+    "coco": COCOExporter,
+    "yolo": YOLOExporter,
+    "rec_bucket": RecBucketExporter,
+}
+
 class OCRDataGenerateToolKit():
     def __init__(
             self,
-            word_list_path: str, 
+            word_list_path, 
             background_path: str,
             font_path: str,
-            num_of_retry: int) -> None:
+            num_of_retry: int,
+            mask_cache_bytes: int = 0) -> None:
 
-        # word
-        with open(word_list_path, 'r') as f:
-            word_list = f.readlines()
-        self.word_list = [word[:-1] for word in word_list]
+        # word, a dictionary path or a list of [path, weight] to sample from
+        self.word_list = WordCorpus(word_list_path)
 
         # image background list 
         self.background_list = os.listdir(background_path)
@@ -33,6 +582,15 @@ class OCRDataGenerateToolKit():
 
         # retry number
         self.num_of_retry = num_of_retry
+
+        # rasterized word mask cache, disabled when mask_cache_bytes is 0
+        self.mask_cache = WordMaskCache(mask_cache_bytes) if mask_cache_bytes > 0 else None
+
+        # async image writer, only set while create_dataset runs with num_workers > 0
+        self.writer = None
+
+        # recognition tensor store, only set while create_dataset runs with rec_store_height
+        self.rec_store = None
     
     def _calculate_relative_luminance(self, color):
         if type(color) == int:
@@ -124,24 +682,35 @@ class OCRDataGenerateToolKit():
             choosen_color = random.choice(dark_color_palette) if luminance > 0.5 else random.choice(light_color_palette)
         return choosen_color
 
-    def __draw_text_with_shadow(self, draw, position, text, font, text_color, shadow_color, shadow_offset):
+    def _draw_text(self, image, draw, position, text, font, fill):
+        # without cache (or on palette images) let PIL rasterize the text directly
+        if self.mask_cache is None or image.mode not in ("RGB", "RGBA", "L"):
+            draw.text(position, text, font=font, fill=fill)
+            return
+
+        mask, (x0, y0) = self.mask_cache.get(text, font)
+        x = int(round(position[0])) + x0
+        y = int(round(position[1])) + y0
+        image.paste(fill, (x, y, x + mask.width, y + mask.height), mask)
+
+    def __draw_text_with_shadow(self, image, draw, position, text, font, text_color, shadow_color, shadow_offset):
         # Draw the shadow
         shadow_position = (position[0] + shadow_offset, position[1] + shadow_offset)
-        draw.text(shadow_position, text, font=font, fill=shadow_color)
+        self._draw_text(image, draw, shadow_position, text, font, shadow_color)
 
         # Draw the actual text on top
-        draw.text(position, text, font=font, fill=text_color)
+        self._draw_text(image, draw, position, text, font, text_color)
     
-    def __draw_text_with_stroke(self, draw, position, text, font, text_color, stroke_color, stroke_width):
+    def __draw_text_with_stroke(self, image, draw, position, text, font, text_color, stroke_color, stroke_width):
         # Draw the shadow
         x, y = position
-        draw.text((x-stroke_width, y-stroke_width), text, font=font, fill=stroke_color)
-        draw.text((x+stroke_width, y-stroke_width), text, font=font, fill=stroke_color)
-        draw.text((x-stroke_width, y+stroke_width), text, font=font, fill=stroke_color)
-        draw.text((x+stroke_width, y+stroke_width), text, font=font, fill=stroke_color)
+        self._draw_text(image, draw, (x-stroke_width, y-stroke_width), text, font, stroke_color)
+        self._draw_text(image, draw, (x+stroke_width, y-stroke_width), text, font, stroke_color)
+        self._draw_text(image, draw, (x-stroke_width, y+stroke_width), text, font, stroke_color)
+        self._draw_text(image, draw, (x+stroke_width, y+stroke_width), text, font, stroke_color)
 
         # Draw the actual text on top
-        draw.text(position, text, font=font, fill=text_color)
+        self._draw_text(image, draw, position, text, font, text_color)
 
     def add_text_to_image(
             self, 
@@ -154,7 +723,7 @@ class OCRDataGenerateToolKit():
         draw = ImageDraw.Draw(image)
 
         # RANDOM TEXT TO GENERATE
-        text = random.choice(self.word_list)
+        text = self.word_list.sample()
 
         # RANDOM FONT SIZE
         font_size_range = getattr(self, font_size_range)
@@ -228,6 +797,7 @@ class OCRDataGenerateToolKit():
             
             if effect == "shadow":
                 self.__draw_text_with_shadow(
+                    image = image,
                     draw = draw,
                     position = text_position, 
                     text = text, 
@@ -238,6 +808,7 @@ class OCRDataGenerateToolKit():
                 )
             elif effect == "stroke":
                 self.__draw_text_with_stroke(
+                    image = image,
                     draw = draw,
                     position = text_position, 
                     text = text, 
@@ -247,11 +818,13 @@ class OCRDataGenerateToolKit():
                     stroke_width = stroke_width
                 )
             else:
-                draw.text(
-                    xy = text_position, 
+                self._draw_text(
+                    image = image,
+                    draw = draw,
+                    position = text_position, 
                     text = text, 
-                    fill = text_color, 
                     font = font, 
+                    fill = text_color, 
                 )
         
             polygon = [[text_box[0], text_box[1]],
@@ -266,121 +839,118 @@ class OCRDataGenerateToolKit():
         else:
             return None, None, None 
 
+    def _load_background(self):
+        image_name = random.choice(self.background_list)
+        return Image.open(os.path.join(self.background_dir, image_name))
+
+    def _decode_background(self, image_name):
+        image = Image.open(os.path.join(self.background_dir, image_name))
+        image.load()
+        return image
+
+    def _save_image(self, image, path):
+        if self.writer is None:
+            image.save(path)
+        else:
+            self.writer.submit(image, path)
+
+    def _random_tiles(self, background, num_of_tiles, tile_scale = [0.5, 1.0], min_tile_size = 64, tile_size = None):
+        # Take several random crops from one decoded background, so the decode cost
+        # is shared by num_of_tiles output images. Each side of a tile is a random
+        # fraction (tile_scale) of the background side, but never below min_tile_size,
+        # or a fixed (width, height) when tile_size is given. Tiles never exceed the background.
+        width, height = background.size
+        tiles = []
+        for _ in range(num_of_tiles):
+            if tile_size is not None:
+                tile_width, tile_height = min(width, tile_size[0]), min(height, tile_size[1])
+            else:
+                tile_width = min(width, max(min_tile_size, int(width * random.uniform(*tile_scale))))
+                tile_height = min(height, max(min_tile_size, int(height * random.uniform(*tile_scale))))
+            x = random.randint(0, width - tile_width)
+            y = random.randint(0, height - tile_height)
+            tiles.append(background.crop((x, y, x + tile_width, y + tile_height)))
+        return tiles
+
+    def _pyramid_size(self, width, height, scale):
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def _rescale_instances(self, result_dec, scale_x, scale_y):
+        # rescale bbox and polygon of all the instances in one numpy step
+        if len(result_dec) == 0:
+            return []
+        bboxes = np.asarray([dec["bbox"] for dec in result_dec], dtype=np.float64) * [scale_x, scale_y, scale_x, scale_y]
+        polygons = np.asarray([dec["polygon"] for dec in result_dec], dtype=np.float64) * [scale_x, scale_y]
+        return [
+            dict(dec, bbox=bbox, polygon=polygon)
+            for dec, bbox, polygon in zip(result_dec, bboxes.tolist(), polygons.tolist())
+        ]
+
     def create_image_data(
             self, 
             name_index,
             fontsize_collection = [0, 0, 0, 0],
             add_type = None,
+            background = None,
+            pyramid_scales = [],
             ):
         result_dec = []
         result_rec = []
 
-        no_small, no_medium, no_large, no_extreme = fontsize_collection
-        image_name = random.choice(self.background_list)
-        image = Image.open(os.path.join(self.background_dir, image_name))
+        # background can be given by the caller (e.g. a tile of a shared background)
+        if background is None:
+            image = self._load_background()
+        else:
+            image = background
         width, height = image.size
         red_zone_x = (height + 1, -1)
         red_zone_y = (height + 1, -1)
         text_index = 0
 
-        for i in range(no_small):
+        font_size_ranges = ['small', 'medium', 'large', 'extreme_large']
+        for font_size_range, no_text in zip(font_size_ranges, fontsize_collection):
             # if the text is small, we don't use Stroke style for the text here
-            text, polygon, quad = self.add_text_to_image(
-                image, red_zone_x, red_zone_y, 
-                font_size_range='small', 
-                add_type = add_type if add_type != "stroke" else None
-            )
-            if text == None:
-                continue
-
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            crop_image.save(os.path.join(self.folder, self.name, "text_crop/", f"image_{name_index}_{text_index}.jpg"))
-            text_index += 1
-
-        for i in range(no_medium):
-            text, polygon, quad = self.add_text_to_image(image, red_zone_x, red_zone_y, font_size_range='medium', add_type = add_type)
-            if text == None:
-                continue
-            
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            crop_image.save(os.path.join(self.folder, self.name, "text_crop/", f"image_{name_index}_{text_index}.jpg"))
-            text_index += 1
-
-        for i in range(no_large):
-            text, polygon, quad = self.add_text_to_image(image, red_zone_x, red_zone_y, font_size_range='large', add_type = add_type)
-            if text == None:
-                continue
-            
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            crop_image.save(os.path.join(self.folder, self.name, "text_crop/", f"image_{name_index}_{text_index}.jpg"))
-            text_index += 1
-
-        for i in range(no_extreme):
-            text, polygon, quad = self.add_text_to_image(image, red_zone_x, red_zone_y, font_size_range='extreme_large', add_type = add_type)
-            if text == None:
-                continue
-            
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            crop_image.save(os.path.join(self.folder, self.name, "text_crop/", f"image_{name_index}_{text_index}.jpg"))
-            text_index += 1
-
-        image.save(os.path.join(self.folder, self.name, 'textdet/', f"image_{name_index}.jpg"))
+            effect = add_type
+            if font_size_range == 'small' and add_type == "stroke":
+                effect = None
+
+            for i in range(no_text):
+                text, polygon, quad = self.add_text_to_image(
+                    image, red_zone_x, red_zone_y, 
+                    font_size_range=font_size_range, 
+                    effect = effect
+                )
+                if text == None:
+                    continue
+
+                result_dec.append({
+                    "polygon": polygon,
+                    "bbox": quad,
+                    "bbox_label":1,
+                    "ignore": False
+                })
+                # crop size is recorded so loaders can bucket without opening the crop
+                crop_image = image.crop(quad)
+                result_rec.append({
+                    "instances":[{
+                        "text": text
+                    }],
+                    "img_path": f"image_{name_index}_{text_index}.jpg",
+                    "width": crop_image.width,
+                    "height": crop_image.height,
+                })
+                red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
+                red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
+                self._save_image(crop_image, os.path.join(self.folder, self.name, "text_crop/", f"image_{name_index}_{text_index}.jpg"))
+                if self.rec_store is not None:
+                    self.rec_store.add(crop_image, text)
+                text_index += 1
+
+        self._save_image(image, os.path.join(self.folder, self.name, 'textdet/', f"image_{name_index}.jpg"))
+        # downscaled copies of the rendered scene, the text is only rendered once
+        for scale in pyramid_scales:
+            scaled_image = image.resize(self._pyramid_size(width, height, scale), Image.BILINEAR, reducing_gap=3.0)
+            self._save_image(scaled_image, os.path.join(self.folder, self.name, f"textdet_{scale}/", f"image_{name_index}.jpg"))
         # image.show()
         return result_dec, width, height, result_rec
     
@@ -389,13 +959,13 @@ class OCRDataGenerateToolKit():
             name_index,
             fontsize_collection = [0, 0, 0, 0],
             add_type = None,
+            contact_sheet = None,
             ):
         result_dec = []
         result_rec = []
+        crops = []
 
-        no_small, no_medium, no_large, no_extreme = fontsize_collection
-        image_name = random.choice(self.background_list)
-        image = Image.open(os.path.join(self.background_dir, image_name))
+        image = self._load_background()
         width, height = image.size
 
         print(f"Image test: {name_index}, with width: {width} and height: {height}")
@@ -404,138 +974,61 @@ class OCRDataGenerateToolKit():
         red_zone_y = (height + 1, -1)
         text_index = 0
 
-        for i in range(no_small):
+        font_size_ranges = ['small', 'medium', 'large', 'extreme_large']
+        for font_size_range, no_text in zip(font_size_ranges, fontsize_collection):
             # if the text is small, we don't use Stroke style for the text here
-            text, polygon, quad = self.add_text_to_image(
-                image, red_zone_x, red_zone_y, 
-                font_size_range='small', 
-                add_type = add_type if add_type != "stroke" else None
-            )
-            if text == None:
-                continue
-
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            print(f"image_{name_index}_{text_index}.jpg")
-            print(f"Text: {text}")
-            print(quad)
-            if (quad[0] < 0 or quad[0] > width or 
-                quad[2] < 0 or quad[2] > width or 
-                quad[1] < 0 or quad[1] > height or 
-                quad[3] < 0 or quad[3] > height):
-                print("Out of image !!!")
-            crop_image.show()
-            text_index += 1
-
-        for i in range(no_medium):
-            text, polygon, quad = self.add_text_to_image(image, red_zone_x, red_zone_y, font_size_range='medium', add_type = add_type)
-            if text == None:
-                continue
-            
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            print(f"image_{name_index}_{text_index}.jpg")
-            print(f"Text: {text}")
-            print(quad)
-            if (quad[0] < 0 or quad[0] > width or 
-                quad[2] < 0 or quad[2] > width or 
-                quad[1] < 0 or quad[1] > height or 
-                quad[3] < 0 or quad[3] > height):
-                print("Out of image !!!")
-            crop_image.show()
-            text_index += 1
-
-        for i in range(no_large):
-            text, polygon, quad = self.add_text_to_image(image, red_zone_x, red_zone_y, font_size_range='large', add_type = add_type)
-            if text == None:
-                continue
-            
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            print(f"image_{name_index}_{text_index}.jpg")
-            print(f"Text: {text}")
-            print(quad)
-            if (quad[0] < 0 or quad[0] > width or 
-                quad[2] < 0 or quad[2] > width or 
-                quad[1] < 0 or quad[1] > height or 
-                quad[3] < 0 or quad[3] > height):
-                print("Out of image !!!")
-            crop_image.show()
-            text_index += 1
-
-        for i in range(no_extreme):
-            text, polygon, quad = self.add_text_to_image(image, red_zone_x, red_zone_y, font_size_range='extreme_large', add_type = add_type)
-            if text == None:
-                continue
-            
-            result_dec.append({
-                "polygon": polygon,
-                "bbox": quad,
-                "bbox_label":1,
-                "ignore": False
-            })
-            result_rec.append({
-                "instances":[{
-                    "text": text
-                }],
-                "img_path": f"image_{name_index}_{text_index}.jpg"
-            })
-            red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
-            red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
-            crop_image = image.crop(quad)
-            print(f"image_{name_index}_{text_index}.jpg")
-            print(f"Text: {text}")
-            print(quad)
-            if (quad[0] < 0 or quad[0] > width or 
-                quad[2] < 0 or quad[2] > width or 
-                quad[1] < 0 or quad[1] > height or
-                quad[3] < 0 or quad[3] > height):
-                print("Out of image !!!")
-            crop_image.show()
-            text_index += 1
+            effect = add_type
+            if font_size_range == 'small' and add_type == "stroke":
+                effect = None
+
+            for i in range(no_text):
+                text, polygon, quad = self.add_text_to_image(
+                    image, red_zone_x, red_zone_y, 
+                    font_size_range=font_size_range, 
+                    effect = effect
+                )
+                if text == None:
+                    continue
+
+                result_dec.append({
+                    "polygon": polygon,
+                    "bbox": quad,
+                    "bbox_label":1,
+                    "ignore": False
+                })
+                result_rec.append({
+                    "instances":[{
+                        "text": text
+                    }],
+                    "img_path": f"image_{name_index}_{text_index}.jpg"
+                })
+                red_zone_x = (min(quad[0], red_zone_x[0]), max(quad[2], red_zone_x[1]))
+                red_zone_y = (min(quad[1], red_zone_y[0]), max(quad[3], red_zone_y[1]))
+                crop_image = image.crop(quad)
+                print(f"image_{name_index}_{text_index}.jpg")
+                print(f"Text: {text}")
+                print(quad)
+                if (quad[0] < 0 or quad[0] > width or 
+                    quad[2] < 0 or quad[2] > width or 
+                    quad[1] < 0 or quad[1] > height or 
+                    quad[3] < 0 or quad[3] > height):
+                    print("Out of image !!!")
+                if contact_sheet is None:
+                    crop_image.show()
+                else:
+                    crops.append(crop_image)
+                text_index += 1
 
         print(f"image_{name_index}.jpg")
         print(f"Total: detec {len(result_dec)} and recog {len(result_rec)}")
-        image.show()
+        if contact_sheet is None:
+            image.show()
+        else:
+            contact_sheet.add(
+                f"image_{name_index}.jpg", image, crops, 
+                [rec["instances"][0]["text"] for rec in result_rec], 
+                [dec["bbox"] for dec in result_dec]
+            )
         
         return None
 
@@ -552,7 +1045,7 @@ class OCRDataGenerateToolKit():
         draw = ImageDraw.Draw(image)
 
         # RANDOM TEXT TO GENERATE
-        text = random.choice(self.word_list)
+        text = self.word_list.sample()
 
         font = ImageFont.truetype(
             os.path.join(self.font_collection_dir, font_name), 
@@ -597,6 +1090,7 @@ class OCRDataGenerateToolKit():
             
             if effect == "shadow":
                 self.__draw_text_with_shadow(
+                    image = image,
                     draw = draw,
                     position = text_position, 
                     text = text, 
@@ -607,6 +1101,7 @@ class OCRDataGenerateToolKit():
                 )
             elif effect == "stroke":
                 self.__draw_text_with_stroke(
+                    image = image,
                     draw = draw,
                     position = text_position, 
                     text = text, 
@@ -616,11 +1111,13 @@ class OCRDataGenerateToolKit():
                     stroke_width = stroke_width
                 )
             else:
-                draw.text(
-                    xy = text_position, 
+                self._draw_text(
+                    image = image,
+                    draw = draw,
+                    position = text_position, 
                     text = text, 
-                    fill = text_color, 
                     font = font, 
+                    fill = text_color, 
                 )
         
             polygon = [[text_box[0], text_box[1]],
@@ -638,18 +1135,20 @@ class OCRDataGenerateToolKit():
         name_index,
         fontsize_collection = [0, 0, 0, 0],
         add_type = None,
+        contact_sheet = None,
     ):
         result_dec = []
         result_rec = []
+        crops = []
 
         no_small, no_medium, no_large, no_extreme = fontsize_collection
-        image_name = random.choice(self.background_list)
-        image = Image.open(os.path.join(self.background_dir, image_name))
+        image = self._load_background()
         width, height = image.size
 
         print(f"Image test: {name_index}, with width: {width} and height: {height}")
 
         text_index = 0
+        font_name = random.choice(self.font_collection)
 
         start_position = 30
         text_position = (start_position, 0)
@@ -660,7 +1159,7 @@ class OCRDataGenerateToolKit():
         for i in range(no_small):
             # if the text is small, we don't use Stroke style for the text here
             text, polygon, quad, text_leng = self.add_text_to_document(
-                image, text_position, font_size, add_type=add_type
+                image, text_position, font_name, font_size, effect=add_type
             )
             text_position = (text_position[0] + text_leng + space_blank, text_position[1])
             if (text_position[0] >= width - start_position):
@@ -693,13 +1192,16 @@ class OCRDataGenerateToolKit():
                 quad[1] < 0 or quad[1] > height or 
                 quad[3] < 0 or quad[3] > height):
                 print("Out of image !!!")
-            crop_image.show()
+            if contact_sheet is None:
+                crop_image.show()
+            else:
+                crops.append(crop_image)
             text_index += 1
 
         font_size = random.choice(self.medium)
         for i in range(no_medium):
             text, polygon, quad, text_leng = self.add_text_to_document(
-                image, text_position, font_size, add_type=add_type
+                image, text_position, font_name, font_size, effect=add_type
             )
             text_position = (text_position[0] + text_leng + space_blank, text_position[1])
             if (text_position[0] >= width):
@@ -730,12 +1232,14 @@ class OCRDataGenerateToolKit():
                 quad[3] < 0 or quad[3] > height):
                 print("Out of image !!!")
             # crop_image.show()
+            if contact_sheet is not None:
+                crops.append(crop_image)
             text_index += 1
 
         font_size = random.choice(self.large)
         for i in range(no_large):
             text, polygon, quad, text_leng = self.add_text_to_document(
-                image, text_position, font_size, add_type=add_type
+                image, text_position, font_name, font_size, effect=add_type
             )
             text_position = (text_position[0] + text_leng + space_blank, text_position[1])
             if (text_position[0] >= width):
@@ -766,12 +1270,14 @@ class OCRDataGenerateToolKit():
                 quad[3] < 0 or quad[3] > height):
                 print("Out of image !!!")
             # crop_image.show()
+            if contact_sheet is not None:
+                crops.append(crop_image)
             text_index += 1
 
         font_size = random.choice(self.extreme_large)
         for i in range(no_extreme):
             text, polygon, quad, text_leng = self.add_text_to_document(
-                image, text_position, font_size, add_type=add_type
+                image, text_position, font_name, font_size, effect=add_type
             )
             text_position = (text_position[0] + text_leng + space_blank, text_position[1])
             if (text_position[0] >= width):
@@ -802,64 +1308,175 @@ class OCRDataGenerateToolKit():
                 quad[3] < 0 or quad[3] > height):
                 print("Out of image !!!")
             # crop_image.show()
+            if contact_sheet is not None:
+                crops.append(crop_image)
             text_index += 1
 
         print(f"image_{name_index}.jpg")
         print(f"Total: detec {len(result_dec)} and recog {len(result_rec)}")
-        image.show()
+        if contact_sheet is None:
+            image.show()
+        else:
+            contact_sheet.add(
+                f"image_{name_index}.jpg", image, crops, 
+                [rec["instances"][0]["text"] for rec in result_rec], 
+                [dec["bbox"] for dec in result_dec]
+            )
         
         return None
 
+    def create_preview(
+            self,
+            folder,
+            name,
+            num_of_images = 16,
+            fontsize_collection = [0, 0, 0, 0],
+            add_type = [None],
+            images_per_sheet = 8,
+            document = False,
+            ):
+        # same as calling create_image_test / create_document_test in a loop, but every
+        # images_per_sheet images are written as one contact sheet instead of .show()
+        os.makedirs(os.path.join(folder, name, "preview"), exist_ok=True)
+        contact_sheet = ContactSheet(
+            font_path = os.path.join(self.font_collection_dir, self.font_collection[0])
+        )
+        create_test = self.create_document_test if document else self.create_image_test
+
+        for i in range(num_of_images):
+            create_test(
+                i, 
+                fontsize_collection = fontsize_collection, 
+                add_type = random.choice(add_type), 
+                contact_sheet = contact_sheet
+            )
+            if len(contact_sheet.entries) == images_per_sheet or i == num_of_images - 1:
+                contact_sheet.save(os.path.join(folder, name, "preview", f"sheet_{i // images_per_sheet}.jpg"))
+
     def create_dataset(
             self,
             folder,
             name,
             data = [[100, [10, 0, 0, 0]]],
             add_type = [None],
+            tiles_per_background = 1,
+            tile_scale = [0.5, 1.0],
+            min_tile_size = 64,
+            tile_size = None,
+            num_workers = 0,
+            max_pending_writes = 64,
+            prefetch_backgrounds = 8,
+            rec_store_height = None,
+            rec_store_mode = "RGB",
+            exporters = ["mmocr"],
+            pyramid_scales = [],
             ):
+        # arguments are checked before any folder is created, the pyramid only holds
+        # downscaled copies of the rendered scene
+        for scale in pyramid_scales:
+            if not 0 < scale < 1:
+                raise ValueError(f"Pyramid scale must be in (0, 1), got: {scale}")
+        for exporter in exporters:
+            if isinstance(exporter, str) and exporter not in EXPORTERS:
+                raise ValueError(f"Unknown exporter: {exporter}, choose from {list(EXPORTERS)}")
+
         os.makedirs(os.path.join(folder, name), exist_ok=True)
         os.makedirs(os.path.join(folder, name, "textdet"), exist_ok=True)
+        for scale in pyramid_scales:
+            os.makedirs(os.path.join(folder, name, f"textdet_{scale}"), exist_ok=True)
         os.makedirs(os.path.join(folder, name, "text_crop"), exist_ok=True)
         self.folder = folder
         self.name = name
 
-        detectset = {
-            "metainfo":{
-                "dataset_type":"TextDetDataset",
-                "task_name":"textdet",
-                "category":[{
-                    "id":0,
-                    "name":"text"
-                }]
-            },
-            "data_list":[]
-            }
-        recogset = {
-            "metainfo":{
-                "dataset_type":"TextRecogDataset",
-                "task_name":"textrecog"
-            },
-            "data_list":[]
-            }
-        
-        image_id = 0
-        for config in data:
-            for i in tqdm(range(config[0]), desc = f"Create the subset: {config}"):
-                result_dec, width, height, result_rec = self.create_image_data(
-                    image_id,
-                    fontsize_collection=config[1],
-                    add_type = random.choice(add_type),
-                )
-                detectset["data_list"].append({
-                    "instances": result_dec,
-                    "img_path": f"image_{image_id}.jpg",
-                    "height": height,
-                    "width": width,
-                })
-                recogset["data_list"] += (result_rec)
-                image_id += 1
+        # every generated image is handed to each exporter, by name (see EXPORTERS) or as an
+        # object with add_image() / close()
+        exporters = [
+            EXPORTERS[exporter](os.path.join(folder, name)) if isinstance(exporter, str) else exporter
+            for exporter in exporters
+        ]
+
+        # each pyramid scale gets its own det manifest, det_train_{scale}.json for textdet_{scale}/
+        pyramid_exporters = [
+            MMOCRExporter(os.path.join(folder, name), det_file=f"det_train_{scale}.json", rec_file=None)
+            for scale in pyramid_scales
+        ]
+
+        # with num_workers > 0, background decode and image encode/write run on thread
+        # pools while the layout and drawing stay on this thread (same order and naming)
+        prefetcher = None
+        load_background = self._load_background
+        if num_workers > 0:
+            self.writer = AsyncImageWriter(num_workers, max_pending_writes)
+            prefetcher = BackgroundPrefetcher(
+                self._decode_background, self.background_list, 
+                num_workers = num_workers, prefetch = prefetch_backgrounds
+            )
+            load_background = prefetcher.get
+
+        # also export the rec crops, resized to rec_store_height, into a memmap store
+        if rec_store_height is not None:
+            self.rec_store = RecTensorStoreWriter(
+                os.path.join(folder, name, "rec_store"), 
+                height = rec_store_height, mode = rec_store_mode
+            )
 
-        with open(os.path.join(folder, name, "det_train.json"), 'w') as f:
-            json.dump(detectset, f)
-        with open(os.path.join(folder, name, "rec_train.json"), 'w') as f:
-            json.dump(recogset, f)
+        try:
+            image_id = 0
+            tiles = []
+            for config in data:
+                for i in tqdm(range(config[0]), desc = f"Create the subset: {config}"):
+                    # with tiles_per_background > 1, one decoded background feeds several images
+                    background = None
+                    if tiles_per_background > 1:
+                        if len(tiles) == 0:
+                            tiles = self._random_tiles(
+                                load_background(), tiles_per_background, tile_scale, 
+                                min_tile_size = min_tile_size, tile_size = tile_size
+                            )
+                        background = tiles.pop(0)
+                    elif prefetcher is not None:
+                        background = load_background()
+
+                    result_dec, width, height, result_rec = self.create_image_data(
+                        image_id,
+                        fontsize_collection=config[1],
+                        add_type = random.choice(add_type),
+                        background = background,
+                        pyramid_scales = pyramid_scales,
+                    )
+                    for exporter in exporters:
+                        exporter.add_image(image_id, f"image_{image_id}.jpg", width, height, result_dec, result_rec)
+                    for scale, exporter in zip(pyramid_scales, pyramid_exporters):
+                        scaled_width, scaled_height = self._pyramid_size(width, height, scale)
+                        exporter.add_image(
+                            image_id, f"image_{image_id}.jpg", scaled_width, scaled_height, 
+                            self._rescale_instances(result_dec, scaled_width / width, scaled_height / height), 
+                            result_rec
+                        )
+                    image_id += 1
+        finally:
+            # the writer and the rec store are taken off the toolkit before closing, so an
+            # error raised by a close never leaves them behind for the next call
+            writer, self.writer = self.writer, None
+            rec_store, self.rec_store = self.rec_store, None
+            try:
+                if prefetcher is not None:
+                    prefetcher.close()
+            finally:
+                try:
+                    if writer is not None:
+                        writer.close()
+                finally:
+                    # images.bin is closed however the writer close ends
+                    if rec_store is not None:
+                        rec_store.close_file()
+
+        # only reached when the generation succeeded, the manifests and the rec store
+        # index are written together
+        for exporter in exporters + pyramid_exporters:
+            exporter.close()
+        if rec_store is not None:
+            rec_store.close()
+
+        if self.mask_cache is not None:
+            print(f"Word mask cache: {self.mask_cache.stats()}")